@@ -5,7 +5,8 @@
 import streamlit as st
 from PIL import Image
 from io import BytesIO
-import random, os, glob
+import random, os, shutil
+from concurrent.futures import ThreadPoolExecutor
 
 dark_css = """
 <style>
@@ -97,103 +98,179 @@ st.markdown(dark_css, unsafe_allow_html=True)
 
 
 DEFAULT_CARDS_DIR = "cards"
+_RNG = random.Random()  # własna instancja — nie dotykamy globalnego stanu random
 HAND_SIZE = 3  # stała: ręka zawsze 3
+MAX_CARD_PX = 512  # karty i tak lądują w kolumnie ~300px — pełna rozdzielczość to strata
+STATIC_CARDS_DIR = os.path.join("static", "cards")  # wymaga enableStaticServing
 
 # ---------- Utils ----------
-def load_png_bytes_from_folder(folder: str):
-    paths = sorted(glob.glob(os.path.join(folder, "*.png")))
-    imgs = []
-    for p in paths:
-        with Image.open(p) as im:
-            buf = BytesIO()
-            im.convert("RGBA").save(buf, format="PNG")
-            imgs.append(buf.getvalue())
-    return imgs, paths
+def _dir_signature(folder: str):
+    # klucz cache: folder + mtime + lista plików — zmiana zawartości unieważnia cache
+    return (folder, os.stat(folder).st_mtime_ns, tuple(sorted(os.listdir(folder))))
+
+def _display_bytes(p: str) -> bytes:
+    # WebP wychodzi 2-4x mniejszy od PNG przy grafice kart; alpha zostaje
+    with Image.open(p) as im:
+        if max(im.size) > MAX_CARD_PX:
+            im.thumbnail((MAX_CARD_PX, MAX_CARD_PX), Image.LANCZOS)
+        buf = BytesIO()
+        im.save(buf, format="WEBP", quality=85, method=4)
+        return buf.getvalue()
+
+@st.cache_data(show_spinner=False)
+def _list_cached(sig):
+    folder = sig[0]
+    # os.scandir: jeden getdents, bez fnmatch na każdym wpisie jak w glob
+    return sorted(
+        e.path for e in os.scandir(folder)
+        if e.is_file() and e.name.lower().endswith(".png")
+    )
+
+def list_png_paths(folder: str):
+    return _list_cached(_dir_signature(folder))
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _card_url(path: str, mtime: int) -> str:
+    # leniwe ładowanie: miniatura pisana do static/ przy pierwszym pokazaniu;
+    # potem przez websocket idzie tylko krótki URL, a przeglądarka trzyma
+    # plik we własnym cache (mtime w nazwie robi za cache-buster)
+    os.makedirs(STATIC_CARDS_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    fname = f"{stem}-{mtime}.webp"
+    out = os.path.join(STATIC_CARDS_DIR, fname)
+    if not os.path.exists(out):
+        with open(out, "wb") as f:
+            f.write(_display_bytes(path))
+    return f"app/static/cards/{fname}"
+
+def card_url(path: str) -> str:
+    return _card_url(path, os.stat(path).st_mtime_ns)
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _card_full_url(path: str, mtime: int) -> str:
+    # pełna rozdzielczość tylko na żądanie (klik) — siatka ręki zostaje
+    # przy miniaturach, oryginał to kopia 1:1 bez żadnego przekodowania
+    full_dir = os.path.join(STATIC_CARDS_DIR, "full")
+    os.makedirs(full_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    fname = f"{stem}-{mtime}.png"
+    out = os.path.join(full_dir, fname)
+    if not os.path.exists(out):
+        shutil.copyfile(path, out)
+    return f"app/static/cards/full/{fname}"
+
+def card_full_url(path: str) -> str:
+    return _card_full_url(path, os.stat(path).st_mtime_ns)
+
+def warm_card_urls(paths):
+    # Pillow i zapis na dysk zwalniają GIL — miniatury całego zestawu
+    # powstają równolegle, zanim pierwsza karta trafi na ekran
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        list(ex.map(card_url, paths))
 
 def ensure_state():
     for k, v in {
-        "images": [],
         "image_paths": [],
         "deck": [],
         "discard": [],
         "hand": [],
+        "hand_set": set(),
         "exhausted": False,
+        "init_attempted": False,
     }.items():
         if k not in st.session_state:
             st.session_state[k] = v
 
-def init_deck(images, image_paths):
-    st.session_state.images = images
+def init_deck(image_paths):
     st.session_state.image_paths = image_paths
-    st.session_state.deck = list(range(len(images)))
-    random.shuffle(st.session_state.deck)
+    # random.sample robi Fishera-Yatesa w C — bez osobnego range-list + shuffle
+    st.session_state.deck = _RNG.sample(range(len(image_paths)), len(image_paths))
     st.session_state.discard = []
     st.session_state.hand = []
+    st.session_state.hand_set = set()
     st.session_state.exhausted = False
-    clear_all_discard_flags()
+    st.session_state.pop("discard_selection", None)  # zaznaczenie z poprzedniej rundy
 
 def draw_to_hand_size():
     hand = st.session_state.hand
+    hand_set = st.session_state.hand_set
     deck = st.session_state.deck
     target = HAND_SIZE
-    while len(hand) < target and deck:
-        nxt = deck.pop()
-        if nxt not in hand:
-            hand.append(nxt)
+    if len(hand) >= target:
+        return  # ręka pełna — rerun bez dobierania nic nie zmienia
+    # talia to unikalne ID, które nigdy nie wracają z ręki/odrzutu — dobieramy
+    # jednym wycięciem z końca zamiast pętli pop() z martwym testem członkostwa
+    k = min(target - len(hand), len(deck))
+    if k:
+        taken = deck[-k:]
+        del deck[-k:]
+        taken.reverse()  # ta sama kolejność co przy kolejnych pop()
+        if __debug__:
+            assert hand_set.isdisjoint(taken), "karta z talii już w ręce"
+        hand.extend(taken)
+        hand_set.update(taken)
     st.session_state.exhausted = len(hand) < target and len(deck) == 0
-    clear_obsolete_discard_flags()  # sprzątaj flagi
 
 def counters():
     st.caption(
         f"Ręka: **{len(st.session_state.hand)}** | "
         f"W talii: **{len(st.session_state.deck)}** | "
         f"Odrzucone: **{len(st.session_state.discard)}** | "
-        f"Kart w zestawie: **{len(st.session_state.images)}**"
+        f"Kart w zestawie: **{len(st.session_state.image_paths)}**"
     )
 
-def discard_key(idx: int) -> str:
-    # STABILNY klucz po ID karty w talii
-    return f"discard_card_{idx}"
-
-def clear_obsolete_discard_flags():
-    """Usuń z session_state flagi kart, których nie ma już ani w ręce, ani w talii."""
-    alive = set(st.session_state.hand) | set(st.session_state.deck)
-    to_del = [
-        k for k in list(st.session_state.keys())
-        if k.startswith("discard_card_")
-        and (int(k.split("_")[-1]) not in alive)
-    ]
-    for k in to_del:
-        st.session_state.pop(k, None)
-
-def clear_all_discard_flags():
-    for k in [k for k in list(st.session_state.keys()) if k.startswith("discard_card_")]:
-        st.session_state.pop(k, None)
-
+@st.fragment
 def render_hand_ui():
+    # zmiana zaznaczenia w multiselect rerunuje tylko ten fragment —
+    # reszta skryptu (liczniki, przyciski) nie jest przeliczana
     hand = st.session_state.hand
-    images = st.session_state.images
-    cols = st.columns(max(HAND_SIZE, 1), gap="small")
+    paths = st.session_state.image_paths
+    if not hand:
+        return
+
+    # jeden element markdown na całą rękę; obrazki idą przez statyczny
+    # serwing Streamlita, więc rerun wysyła tylko URL-e, nie bajty PNG
+    # miniatura w siatce, klik otwiera oryginał w nowej karcie
+    imgs_html = "".join(
+        f'<a href="{card_full_url(paths[idx])}" target="_blank">'
+        f'<img src="{card_url(paths[idx])}" style="width:220px"></a>'
+        for idx in hand
+    )
+    st.markdown(
+        f'<div style="display:flex;gap:8px">{imgs_html}</div>',
+        unsafe_allow_html=True,
+    )
 
-    for pos, idx in enumerate(hand):
-        with cols[pos % max(HAND_SIZE, 1)]:
-            img = Image.open(BytesIO(images[idx]))
-            # używaj use_container_width zamiast deprecated use_column_width
-            st.image(img, use_container_width=True)
-            # CHECKBOX ma klucz po ID karty, nie po pozycji
-            st.checkbox("Odrzuć tę kartę", key=discard_key(idx))
+    # jedna kontrolka zamiast checkboxa na kartę — jeden wpis w session_state
+    # i zero sprzątania kluczy; opcje to STABILNE ID kart, nie pozycje
+    st.session_state.setdefault("discard_selection", [])
+    st.session_state.discard_selection = [
+        i for i in st.session_state.discard_selection if i in st.session_state.hand_set
+    ]
+    st.multiselect(
+        "Odrzuć karty",
+        options=hand,
+        format_func=lambda i: f"Karta {hand.index(i) + 1}",
+        key="discard_selection",
+    )
 
 # ---------- App ----------
 def main():
     ensure_state()
     st.title("Spearhead cards picker")
 
-    # Auto-init z 'cards/'
-    if not st.session_state.images:
+    # Auto-init z 'cards/' — tylko scandir + tasowanie, bajty dociągane leniwie
+    if not st.session_state.image_paths:
+        if st.session_state.init_attempted:
+            # nieudany init nie skanuje ponownie przy każdym rerunie
+            st.error(f"Brak kart w '{DEFAULT_CARDS_DIR}'. Popraw folder i odśwież stronę.")
+            st.stop()
+        st.session_state.init_attempted = True
         if os.path.isdir(DEFAULT_CARDS_DIR):
-            imgs, paths = load_png_bytes_from_folder(DEFAULT_CARDS_DIR)
-            if imgs:
-                init_deck(imgs, paths)
+            paths = list_png_paths(DEFAULT_CARDS_DIR)
+            if paths:
+                warm_card_urls(paths)
+                init_deck(paths)
             else:
                 st.error(f"Brak plików .png w: '{DEFAULT_CARDS_DIR}'")
                 st.stop()
@@ -204,7 +281,6 @@ def main():
     if not st.session_state.hand:
         draw_to_hand_size()
 
-    counters()
     render_hand_ui()
     counters()
 
@@ -212,13 +288,17 @@ def main():
 
     # 1) Odrzuć zaznaczone (bez dobierania)
     if left.button("Odrzuć zaznaczone"):
-        removed_any = False
-        for idx in list(st.session_state.hand):
-            if st.session_state.get(discard_key(idx), False):
-                st.session_state.hand.remove(idx)
-                st.session_state.discard.append(idx)
-                st.session_state.pop(discard_key(idx), None)
-                removed_any = True
+        hand = st.session_state.hand
+        # jeden przebieg filtrem zamiast remove() w pętli — pozostałe karty
+        # nie zmieniają kolejności; zaznaczenie samo się czyści przy następnym
+        # rerunie, bo odrzucone ID wypadają z opcji multiselecta
+        selected_set = set(st.session_state.get("discard_selection", []))
+        selected = [i for i in hand if i in selected_set]
+        if selected:
+            st.session_state.hand = [i for i in hand if i not in selected_set]
+            st.session_state.hand_set.difference_update(selected)
+            st.session_state.discard.extend(selected)
+        removed_any = bool(selected)
         if not removed_any:
             st.info("Nie zaznaczono żadnej karty do odrzucenia.")
         st.session_state.exhausted = (
@@ -231,8 +311,8 @@ def main():
 
     # 3) Reset rundy (przetasuj aktualny zestaw)
     if st.button("🔄 Reset rundy"):
-        if st.session_state.images:
-            init_deck(st.session_state.images, st.session_state.image_paths)
+        if st.session_state.image_paths:
+            init_deck(st.session_state.image_paths)
             st.success("Zresetowano rundę i przetasowano talię.")
 
     if st.session_state.exhausted: